@@ -41,7 +41,7 @@ class EmmetExpandAbbreviation(sublime_plugin.TextCommand):
         trk = tracker.get_tracker(self.view)
 
         if trk and trk.region.contains(caret):
-            if trk.abbreviation and 'error' not in trk.abbreviation:
+            if trk.abbreviation and not trk.abbreviation.error:
                 snippet = expand_abbreviation(self.view, trk)
                 utils.replace_with_snippet(self.view, edit, trk.region, snippet)
 
@@ -135,7 +135,7 @@ class AbbreviationMarkerListener(sublime_plugin.EventListener):
             if trk:
                 for s in view.sel():
                     if trk.region.contains(s):
-                        return trk.forced or (trk.abbreviation and 'error' not in trk.abbreviation)
+                        return trk.forced or bool(trk.abbreviation and not trk.abbreviation.error)
 
             return False
 
@@ -184,20 +184,20 @@ def should_stop_tracking(trk: tracker.RegionTracker, pos: int) -> bool:
         # Never reset forced abbreviation: it’s up to user how to handle it
         return False
 
-    if not trk.abbreviation or re.search(r'[\n\r]', trk.abbreviation['abbr']):
+    if not trk.abbreviation or re.search(r'[\n\r]', trk.abbreviation.abbr):
         # — Stop tracking if abbreviation is empty
         # — Never allow new lines in auto-tracked abbreviation
         return True
 
     # Reset if user entered invalid character at the end of abbreviation
     # or at the edge of auto-inserted paried character like `)` or `]`
-    if 'error' in trk.abbreviation:
+    if trk.abbreviation.error:
         if trk.region.end() == pos:
             # Last entered character is invalid
             return True
 
         pairs_end = pairs.values()
-        abbr = trk.abbreviation['abbr']
+        abbr = trk.abbreviation.abbr
         start = trk.region.begin()
         target_pos = trk.region.end()
         while target_pos > start:
@@ -285,7 +285,7 @@ def expand_abbreviation(view: sublime.View, trk: tracker.RegionTracker) -> str:
         # in large document
         emmet.attach_context(view, trk.region.begin(), trk.config)
 
-    return emmet.expand(trk.abbreviation['abbr'], trk.config)
+    return emmet.expand(trk.abbreviation.abbr, trk.config)
 
 def plugin_unloaded():
     for wnd in sublime.windows():
@@ -1,5 +1,6 @@
 import re
 import html
+import functools
 from .emmet.html_matcher import scan, get_attributes, ElementType
 
 re_tag_end = re.compile(r'\s*\/?>$')
@@ -35,6 +36,7 @@ def highlight(code: str) -> str:
     return ''.join(chunks)
 
 
+@functools.lru_cache(maxsize=1)
 def styles():
     return """
     .dark .tag { color: #77c7b4; }
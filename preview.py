@@ -1,4 +1,3 @@
-import re
 import html
 import sublime
 
@@ -98,7 +97,4 @@ def phantom_content(content):
 
 
 def indent_size(line, width=1):
-    m = re.match(r'\t+', line)
-    if m:
-        return len(m.group(0)) * width
-    return 0
+    return (len(line) - len(line.lstrip('\t'))) * width
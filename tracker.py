@@ -1,5 +1,7 @@
 import re
 import html
+import string
+import collections
 import sublime
 from . import utils
 from . import emmet_sublime as emmet
@@ -11,13 +13,56 @@ from .emmet.abbreviation import parse as markup_parse, Abbreviation as MarkupAbb
 from .emmet.css_abbreviation import parse as stylesheet_parse
 
 cache = {}
+abbr_cache = collections.OrderedDict()
+ABBR_CACHE_MAX_SIZE = 256
 ABBR_REGION_ID = 'emmet-abbreviation'
 ABBR_PREVIEW_ID = 'emmet-abbreviation-preview'
 
+re_err_tail = re.compile(r'\s+at\s\d+$')
+
+ASCII_ALPHA = frozenset(string.ascii_letters)
+
+MARK_OPT = sublime.DRAW_SOLID_UNDERLINE | sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE
+
+settings = None
+_abbr_preview_enabled = True
+_marker_scope = 'region.accent'
+
+
+def init_settings():
+    "Loads settings object and caches hot-path values into module globals"
+    global settings
+    if settings is None:
+        settings = sublime.load_settings('Emmet.sublime-settings')
+        settings.add_on_change('emmet-tracker', handle_settings_change)
+        handle_settings_change()
+
+
+def handle_settings_change():
+    global _abbr_preview_enabled, _marker_scope
+    _abbr_preview_enabled = settings.get('abbreviation_preview', True)
+    _marker_scope = settings.get('marker_scope', 'region.accent')
+    # Cached previews depend on Emmet config (user snippets, output
+    # options): drop them when settings change, same as `emmet_cache`
+    abbr_cache.clear()
+
+class AbbrResult:
+    "Parsed abbreviation data of tracked region"
+    __slots__ = ('abbr', 'simple', 'preview', 'error')
+
+    def __init__(self, abbr: str, simple=False, preview: str = None, error: dict = None):
+        self.abbr = abbr
+        self.simple = simple
+        self.preview = preview
+        self.error = error
+
+
 class RegionTracker:
     __slots__ = ('last_pos', 'last_length', 'region', 'forced', 'config',
                  'abbreviation', 'forced_indicator', 'offset',
-                 '_has_popup_preview', '_phantom_preview')
+                 '_has_popup_preview', '_phantom_preview', '_preview_html_cache',
+                 '_last_abbr', '_preview_config', '_pending_preview_token',
+                 '_last_mark_key')
 
     def __init__(self, start: int, pos: int, length: int, forced=False):
         self.last_pos = pos
@@ -25,20 +70,16 @@ class RegionTracker:
         self.forced = forced
         self.region = sublime.Region(start, pos)
         self.config = {}
-        self.abbreviation = {}
+        self.abbreviation = None
         self.offset = 0
         self.forced_indicator = None
         self._has_popup_preview = False
         self._phantom_preview = None
-
-    def shift(self, offset: int):
-        "Shifts tracker location by given offset"
-        self.region.a += offset
-        self.region.b += offset
-
-    def extend(self, size: int):
-        "Extends or shrinks range by given size"
-        self.region.b += size
+        self._preview_html_cache = None
+        self._last_abbr = None
+        self._preview_config = None
+        self._pending_preview_token = 0
+        self._last_mark_key = None
 
     def is_valid_range(self) -> bool:
         "Check if current region is in valid state"
@@ -46,16 +87,44 @@ class RegionTracker:
 
     def update_abbreviation(self, view: sublime.View):
         "Updates abbreviation data from current tracker"
-        abbr = view.substr(self.region)
-        if self.offset:
-            abbr = abbr[self.offset:]
+        # Apply offset to region before fetching contents to avoid
+        # copying prefix which is sliced off anyway
+        start = self.region.a + self.offset
+        if start >= self.region.b:
+            # Empty region or offset covers it entirely (e.g. JSX prefix
+            # only): nothing to parse
+            self.abbreviation = None
+            self._last_abbr = None
+            return
+
+        abbr = view.substr(sublime.Region(start, self.region.b))
 
         if not self.config:
             self.config = emmet.get_options(view, self.region.a, True)
 
+        if self._preview_config is None:
+            # Same as `self.config` but with `preview` flag: build it once
+            # instead of copying config on every parse
+            self._preview_config = dict(self.config, preview=True)
+
+        if abbr == self._last_abbr and self.abbreviation is not None:
+            # Tracked text is the same as on previous update (e.g. undo
+            # restored it or edit was outside abbreviation): keep parsed data
+            return
+        self._last_abbr = abbr
+        # Text changed: result of any in-flight preview render is stale
+        self._pending_preview_token += 1
+
         self.abbreviation = None
 
-        if not abbr:
+        # Parsing and expanding abbreviation is the most expensive part of
+        # tracking: re-use result from previous runs with the same input,
+        # e.g. when user oscillates with Backspace or moves caret around
+        key = abbr_cache_key(abbr, self.config)
+        cached = abbr_cache.get(key)
+        if cached is not None:
+            abbr_cache.move_to_end(key)
+            self.abbreviation = cached
             return
 
         try:
@@ -67,30 +136,36 @@ class RegionTracker:
                 parsed_abbr = markup_parse(abbr, self.config)
                 simple = is_simple_markup_abbreviation(parsed_abbr)
 
-            preview_config = self.config.copy()
-            preview_config['preview'] = True
-            self.abbreviation = {
-                'abbr': abbr,
-                'simple': simple,
-                'preview': emmet.expand(parsed_abbr, preview_config)
-            }
+            self.abbreviation = AbbrResult(abbr, simple, emmet.expand(parsed_abbr, self._preview_config))
 
         except (ScannerException, TokenScannerException) as err:
-            self.abbreviation = {
-                'abbr': abbr,
-                'error': {
-                    'message': err.message,
-                    'pos': err.pos,
-                    'pointer': '%s^' % ('-' * err.pos, ) if err.pos is not None else ''
-                }
-            }
+            self._preview_html_cache = None
+            self.abbreviation = AbbrResult(abbr, error={
+                'message': err.message,
+                'pos': err.pos,
+                'pointer': '%s^' % ('-' * err.pos, ) if err.pos is not None else ''
+            })
+
+        # Cache failed parse result as well: invalid input is re-entered
+        # just as often as valid one
+        abbr_cache[key] = self.abbreviation
+        if len(abbr_cache) > ABBR_CACHE_MAX_SIZE:
+            abbr_cache.popitem(last=False)
 
     def mark(self, view: sublime.View):
         "Marks tracker in given view"
-        scope = emmet.get_settings('marker_scope', 'region.accent')
-        mark_opt = sublime.DRAW_SOLID_UNDERLINE | sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE
-        view.erase_regions(ABBR_REGION_ID)
-        view.add_regions(ABBR_REGION_ID, [self.region], scope, '', mark_opt)
+        key = (self.region.a, self.region.b, self.forced)
+        if key == self._last_mark_key:
+            # Marker already displayed at the same location: no need to
+            # pay for redundant region and phantom updates
+            return
+        self._last_mark_key = key
+
+        if settings is None:
+            init_settings()
+        # NB: add_regions() replaces previous regions with the same key,
+        # no need to erase them first
+        view.add_regions(ABBR_REGION_ID, [self.region], _marker_scope, '', MARK_OPT)
         if self.forced:
             phantoms = [sublime.Phantom(self.region, forced_indicator('⋮>'), sublime.LAYOUT_INLINE)]
             if not self.forced_indicator:
@@ -99,13 +174,21 @@ class RegionTracker:
 
     def unmark(self, view: sublime.View):
         "Remove current tracker marker from given view"
-        view.erase_regions(ABBR_REGION_ID)
-        view.erase_phantoms(ABBR_REGION_ID)
+        # Every erase call crosses editor API boundary: issue them only for
+        # things that were actually displayed
+        if self._last_mark_key is not None:
+            self._last_mark_key = None
+            view.erase_regions(ABBR_REGION_ID)
+        if self.forced_indicator is not None:
+            self.forced_indicator = None
+            view.erase_phantoms(ABBR_REGION_ID)
         self.hide_preview(view)
 
     def show_preview(self, view: sublime.View, as_phantom=None):
         "Displays expanded preview of abbreviation in current tracker in given view"
-        if not emmet.get_settings('abbreviation_preview', True):
+        if settings is None:
+            init_settings()
+        if not _abbr_preview_enabled:
             return
 
         content = None
@@ -118,26 +201,58 @@ class RegionTracker:
         if not self.abbreviation:
             # No parsed abbreviation: empty region
             pass
-        if 'error' in self.abbreviation:
+        elif self.abbreviation.error:
             # Display error snippet
-            err = self.abbreviation['error']
-            snippet = html.escape( re.sub(r'\s+at\s\d+$', '', err['message']), False)
+            err = self.abbreviation.error
+            snippet = html.escape(re_err_tail.sub('', err['message']), False)
             content = '<div class="error pointer">%s</div><div class="error message">%s</div>' % (err['pointer'], snippet)
-        elif self.forced or as_phantom or not self.abbreviation['simple']:
-            snippet = self.abbreviation['preview']
-            if self.config['type'] != 'stylesheet':
-                if syntax.is_html(self.config['syntax']):
-                    snippet = html_highlight.highlight(snippet)
-                else:
-                    snippet = html.escape(snippet, False)
-                content = '<div class="markup-preview">%s</div>' % format_snippet(snippet)
+        elif self.forced or as_phantom or not self.abbreviation.simple:
+            snippet = self.abbreviation.preview
+            # Highlighting and formatting snippet is not cheap: re-use HTML
+            # from previous call if expanded preview is the same
+            key = (snippet, self.config['syntax'], self.config['type'], as_phantom)
+            if self._preview_html_cache and self._preview_html_cache[0] == key:
+                content = self._preview_html_cache[1]
             else:
-                content = format_snippet(snippet)
+                # Highlighting large snippets is too slow for UI thread:
+                # debounce and render in worker thread, then publish result
+                # back unless a newer update superseded this one
+                self._pending_preview_token += 1
+                token = self._pending_preview_token
+                sublime.set_timeout_async(lambda: self._render_preview(view, key, token), 40)
+                return
 
         if not content:
             self.hide_preview(view)
             return
 
+        self._display_preview(view, content, as_phantom)
+
+    def _render_preview(self, view: sublime.View, key: tuple, token: int):
+        "Renders preview HTML in worker thread and displays it from UI thread"
+        if token != self._pending_preview_token:
+            return
+
+        snippet, syntax_name, config_type, as_phantom = key
+        if config_type != 'stylesheet':
+            if syntax.is_html(syntax_name):
+                snippet = html_highlight.highlight(snippet)
+            else:
+                snippet = html.escape(snippet, False)
+            content = '<div class="markup-preview">%s</div>' % format_snippet(snippet)
+        else:
+            content = format_snippet(snippet)
+
+        self._preview_html_cache = (key, content)
+
+        def display():
+            if token == self._pending_preview_token:
+                self._display_preview(view, content, as_phantom)
+
+        sublime.set_timeout(display)
+
+    def _display_preview(self, view: sublime.View, content: str, as_phantom: bool):
+        "Displays given preview HTML as phantom or popup"
         if as_phantom:
             if not self._phantom_preview:
                 self._phantom_preview = sublime.PhantomSet(view, ABBR_PREVIEW_ID)
@@ -156,6 +271,7 @@ class RegionTracker:
 
     def hide_preview(self, view: sublime.View):
         "Hides preview of current abbreviation in given view"
+        self._pending_preview_token += 1
         if self._has_popup_preview:
             view.hide_popup()
             self._has_popup_preview = False
@@ -165,14 +281,20 @@ class RegionTracker:
 
 
 def handle_change(view: sublime.View):
-    tracker = get_tracker(view)
+    # NB: hottest lookup in plugin, read cache directly to avoid an extra
+    # function call per keystroke
+    tracker = cache.get(view.id())
     if not tracker:
         return
 
+    # Cache region bounds in locals: crossing the region proxy costs more
+    # than a plain attribute read and they are tested multiple times below
     last_pos = tracker.last_pos
     region = tracker.region
+    region_a = region.a
+    region_b = region.b
 
-    if last_pos < region.a or last_pos > region.b:
+    if last_pos < region_a or last_pos > region_b:
         # Updated content outside abbreviation: reset tracker
         stop_tracking(view)
         return
@@ -188,14 +310,15 @@ def handle_change(view: sublime.View):
 
     if delta < 0:
         # Removed some content
-        if last_pos == region.a:
+        if last_pos == region_a:
             # Updated content at the abbreviation edge
-            tracker.shift(delta)
-        elif region.a < last_pos <= region.b:
-            tracker.extend(delta)
-    elif delta > 0 and region.a <= last_pos <= region.b:
+            region.a = region_a + delta
+            region.b = region_b + delta
+        elif region_a < last_pos <= region_b:
+            region.b = region_b + delta
+    elif delta > 0 and region_a <= last_pos <= region_b:
         # Inserted content
-        tracker.extend(delta)
+        region.b = region_b + delta
 
     # Ensure range is in valid state
     if not tracker.is_valid_range():
@@ -208,7 +331,7 @@ def handle_change(view: sublime.View):
 
 
 def handle_selection_change(view: sublime.View, caret=None):
-    tracker = get_tracker(view)
+    tracker = cache.get(view.id())
     if tracker:
         if caret is None:
             caret = utils.get_caret(view)
@@ -237,19 +360,26 @@ def start_tracking(view: sublime.View, start: int, pos: int, **kwargs) -> Region
 
 
 def stop_tracking(view: sublime.View, edit: sublime.Edit = None):
-    key = view.id()
-    if key in cache:
-        tracker = cache.get(key)
+    tracker = cache.pop(view.id(), None)
+    if tracker:
         tracker.unmark(view)
         if tracker.forced and edit:
             # Contents of forced abbreviation must be removed
             view.erase(edit, tracker.region)
-        del cache[key]
 
 
-def preview_popup_html(content: str):
-    style = html_highlight.styles()
-    return """
+def abbr_cache_key(abbr: str, config: dict) -> tuple:
+    "Returns cache key for parsed abbreviation with given config"
+    ctx = config.get('context')
+    return (abbr, config.get('type'), config.get('syntax'), config.get('inline'),
+            id(ctx) if ctx else None)
+
+
+# Static parts of preview and indicator HTML, precomputed at import time:
+# hot path does a single join instead of re-formatting ~500 bytes of markup
+# on every keystroke. Highlight styles are a static string so they can be
+# baked into popup prefix right away
+POPUP_HTML = ("""
     <body id="emmet-preview-popup">
         <style>
             body { line-height: 1.5rem; }
@@ -258,13 +388,11 @@ def preview_popup_html(content: str):
             .markup-preview { font-size: 11px; line-height: 1.3rem; }
             %s
         </style>
-        <div>%s</div>
+        <div>""" % html_highlight.styles(), """</div>
     </body>
-    """ % (style, content)
-
+    """)
 
-def preview_phantom_html(content: str):
-    return """
+PHANTOM_HTML = ("""
     <body id="emmet-preview-phantom">
         <style>
             body {
@@ -277,14 +405,11 @@ def preview_phantom_html(content: str):
 
             .error { color: red }
         </style>
-        <div class="main">%s</div>
+        <div class="main">""", """</div>
     </body>
-    """ % content
+    """)
 
-
-def forced_indicator(content: str):
-    "Returns HTML content of forced abbreviation indicator"
-    return """
+INDICATOR_HTML = ("""
         <body>
             <style>
                 #emmet-forced-abbreviation {
@@ -294,22 +419,35 @@ def forced_indicator(content: str):
                     padding: 1px 3px;
                 }
             </style>
-            <div id="emmet-forced-abbreviation">%s</div>
+            <div id="emmet-forced-abbreviation">""", """</div>
         </body>
-        """ % content
+        """)
+
+
+def preview_popup_html(content: str):
+    return ''.join((POPUP_HTML[0], content, POPUP_HTML[1]))
+
+
+def preview_phantom_html(content: str):
+    return ''.join((PHANTOM_HTML[0], content, PHANTOM_HTML[1]))
+
+
+def forced_indicator(content: str):
+    "Returns HTML content of forced abbreviation indicator"
+    return ''.join((INDICATOR_HTML[0], content, INDICATOR_HTML[1]))
 
 
 def format_snippet(text: str, class_name=None):
     class_attr = (' class="%s"' % class_name) if class_name else ''
-    line_html = '<div%s style="padding-left: %dpx"><code>%s</code></div>'
-    lines = [line_html % (class_attr, indent_size(line, 20), line) for line in text.splitlines()]
+    # Bake constant class attribute into template once instead of
+    # re-substituting it for every line
+    line_html = '<div%s style="padding-left: %%dpx"><code>%%s</code></div>' % class_attr
 
-    return '\n'.join(lines)
+    return '\n'.join(line_html % (indent_size(line, 20), line) for line in text.split('\n'))
 
 
 def indent_size(line, width=1):
-    m = re.match(r'\t+', line)
-    return len(m.group(0)) * width if m else 0
+    return (len(line) - len(line.lstrip('\t'))) * width
 
 
 def is_simple_markup_abbreviation(abbr: MarkupAbbreviation) -> bool:
@@ -318,8 +456,10 @@ def is_simple_markup_abbreviation(abbr: MarkupAbbreviation) -> bool:
     may not be displayed to user as preview to reduce distraction
     """
     if len(abbr.children) == 1 and not abbr.children[0].children:
-        first = abbr.children[0];
+        name = abbr.children[0].name
         # XXX silly check for common snippets like `!`. Should read contents
         # of expanded abbreviation instead
-        return not first.name or first.name.isalpha()
+        # NB: tag names are virtually always ASCII, test against letter set
+        # to avoid Unicode category scan of str.isalpha()
+        return not name or (name[0] in ASCII_ALPHA and not name.strip(string.ascii_letters))
     return not abbr.children